@@ -19,7 +19,7 @@ from .utils import format_time, format_power
 
 
 # init convenient funcs
-def gress(items, *widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample=10, finish=DEFAULT_FINISHED, output=None):
+def gress(items, *widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample=10, finish=DEFAULT_FINISHED, output=None, background=False, chunk=None):
     """
     Initializes a new instance of the progress Bar monitor class and returns its
     iterator filled by given items.
@@ -43,12 +43,16 @@ def gress(items, *widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample
         
         refresh: float
             Minimum number of seconds between individual updates to be
-            displayed.
+            displayed. If the output is redirected to a file or pipe, each
+            update is written as a new line and at least REFRESH_NOTTY
+            seconds apart.
         
         sample: int
-            Number of last sample to keep for adaptive widgets like ETA
-            or speed. Such widgets are calculating progress from last
-            measurements instead of overall progress.
+            Number of last samples to keep for adaptive widgets like ETA
+            or speed. The current value is sampled on each displayed update,
+            regardless of whether it was set or increased. Such widgets are
+            calculating progress from last measurements instead of overall
+            progress.
         
         finish: (Widget,) or str
             Collection of widgets to display on iterator finish. The widget
@@ -60,6 +64,17 @@ def gress(items, *widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample
         output: any
             Custom output to which all the progress and messages are writen.
             This must support 'write' and 'flush' method calls.
+        
+        background: bool
+            If set to True, the displayed bar is refreshed by a background
+            thread every refresh interval, while the updates only store the
+            progress. This is useful if the progress is updated from
+            multiple threads.
+        
+        chunk: int or None
+            Number of iterated items to accumulate before the progress is
+            increased. This reduces the overhead for very fast loops. If
+            set to None, the progress is increased by every item.
     """
     
     # get maximum
@@ -75,13 +90,15 @@ def gress(items, *widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample
         refresh = refresh,
         sample = sample,
         finish = finish,
-        output = output)
+        output = output,
+        background = background,
+        chunk = chunk)
     
     # init iterator
     return _bar(items)
 
 
-def bar(*widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample=10, finish=DEFAULT_FINISHED, output=None):
+def bar(*widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample=10, finish=DEFAULT_FINISHED, output=None, background=False, chunk=None):
     """
     Initializes a new instance of the progress Bar monitor.
     
@@ -104,12 +121,16 @@ def bar(*widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample=10, fini
         
         refresh: float
             Minimum number of seconds between individual updates to be
-            displayed.
+            displayed. If the output is redirected to a file or pipe, each
+            update is written as a new line and at least REFRESH_NOTTY
+            seconds apart.
         
         sample: int
-            Number of last sample to keep for adaptive widgets like ETA
-            or speed. Such widgets are calculating progress from last
-            measurements instead of overall progress.
+            Number of last samples to keep for adaptive widgets like ETA
+            or speed. The current value is sampled on each displayed update,
+            regardless of whether it was set or increased. Such widgets are
+            calculating progress from last measurements instead of overall
+            progress.
         
         finish: (Widget,) or str
             Collection of widgets to display on iterator finish. The widget
@@ -121,6 +142,17 @@ def bar(*widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample=10, fini
         output: any
             Custom output to which all the progress and messages are writen.
             This must support 'write' and 'flush' method calls.
+        
+        background: bool
+            If set to True, the displayed bar is refreshed by a background
+            thread every refresh interval, while the updates only store the
+            progress. This is useful if the progress is updated from
+            multiple threads.
+        
+        chunk: int or None
+            Number of iterated items to accumulate before the progress is
+            increased. This reduces the overhead for very fast loops. If
+            set to None, the progress is increased by every item.
     """
     
     return Bar(
@@ -131,4 +163,6 @@ def bar(*widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample=10, fini
         refresh = refresh,
         sample = sample,
         finish = finish,
-        output = output)
+        output = output,
+        background = background,
+        chunk = chunk)
@@ -4,17 +4,93 @@
 #  Inspired by the original work of Nilton Volpato.
 #  https://github.com/NiltonVolpato/python-progressbar
 
-import re
+import io
+import os
+import sys
+import stat
 import time
-import math
+import string
+import threading
+import functools
+from collections import deque, OrderedDict
 from collections.abc import Iterable
 
 from .enums import *
 from .widgets import Widget
-from .prebuilds import WIDGETS
+from .prebuilds import WIDGETS, create_widget
 
-# init widgets repository
-WIDGETS_PATTERN = re.compile("(\{[a-zA-Z0-9_]+\})")
+# init allowed tag characters
+TAG_CHARS = frozenset(string.ascii_letters + string.digits + "_")
+
+# max number of resolved templates cached per bar
+TEMPLATES_CACHE = 64
+
+
+@functools.lru_cache(maxsize=64)
+def _tokenize_template(template):
+    """Splits template into literal texts and widget tags as ((tag, text),)."""
+    
+    tokens = []
+    start = 0
+    
+    # find opening bracket
+    pos = template.find("{")
+    while pos != -1:
+        
+        # find closing bracket
+        end = template.find("}", pos + 1)
+        if end == -1:
+            break
+        
+        # skip invalid tag
+        name = template[pos+1:end]
+        if not name or not TAG_CHARS.issuperset(name):
+            pos = template.find("{", pos + 1)
+            continue
+        
+        # add preceding text
+        if pos > start:
+            tokens.append((None, template[start:pos]))
+        
+        # add tag
+        tag = template[pos:end+1]
+        tokens.append((tag.lower(), tag))
+        
+        # find next
+        start = end + 1
+        pos = template.find("{", start)
+    
+    # add remaining text
+    if start < len(template):
+        tokens.append((None, template[start:]))
+    
+    return tuple(tokens)
+
+
+def _resolve_template(template):
+    """Initializes predefined widgets given by template string."""
+    
+    variables = {}
+    widgets = []
+    
+    # init template widgets
+    for tag, item in _tokenize_template(template):
+        
+        # get known widget
+        if tag in WIDGETS:
+            if tag not in variables:
+                variables[tag] = create_widget(tag)
+            item = variables[tag]
+        
+        # add to template
+        widgets.append(item)
+    
+    return tuple(widgets), variables
+
+
+# init default widgets
+DEFAULT_BAR_WIDGETS = _resolve_template(DEFAULT_BAR)
+DEFAULT_BAR_NOMAX_WIDGETS = _resolve_template(DEFAULT_BAR_NOMAX)
 
 
 class Bar(object):
@@ -47,11 +123,14 @@ class Bar(object):
         samples:
             Returns last progress samples as ((value, elapsed),).
         
+        timestamp: float
+            Returns current time in seconds since the epoch.
+        
         updates: int
             Returns number of widgets updates.
     """
     
-    def __init__(self, *widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample=10, finish=DEFAULT_FINISHED, output=None):
+    def __init__(self, *widgets, minimum=0, maximum=None, size=80, refresh=0.5, sample=10, finish=DEFAULT_FINISHED, output=None, background=False, chunk=None):
         """
         Initializes a new instance of the progress Bar monitor class.
         
@@ -74,12 +153,16 @@ class Bar(object):
             
             refresh: float
                 Minimum number of seconds between individual updates to be
-                displayed.
+                displayed. If the output is redirected to a file or pipe, each
+                update is written as a new line and at least REFRESH_NOTTY
+                seconds apart.
             
             sample: int
                 Number of last samples to keep for adaptive widgets like ETA
-                or speed. Such widgets are calculating progress from last
-                measurements instead of overall progress.
+                or speed. The current value is sampled on each displayed update,
+                regardless of whether it was set or increased. Such widgets are
+                calculating progress from last measurements instead of overall
+                progress.
             
             finish: (Widget,) or str
                 Collection of widgets to display on iterator finish. The widget
@@ -91,10 +174,24 @@ class Bar(object):
             output: any
                 Custom output to which all the progress and messages are writen.
                 This must support 'write' and 'flush' method calls.
+            
+            background: bool
+                If set to True, the displayed bar is refreshed by a background
+                thread every refresh interval, while the updates only store the
+                progress. This is useful if the progress is updated from
+                multiple threads.
+            
+            chunk: int or None
+                Number of iterated items to accumulate before the progress is
+                increased. This reduces the overhead for very fast loops. If
+                set to None, the progress is increased by every item.
         """
         
         self._variables = {}
+        self._templates = OrderedDict()
         self._widgets = widgets or []
+        self._widgets_initialized = False
+        self._layout = self._make_layout(())
         
         self._widgets_finish = finish or []
         if not isinstance(self._widgets_finish, (list, tuple)):
@@ -107,10 +204,15 @@ class Bar(object):
         
         self._start_time = None
         self._end_time = None
+        self._frame_elapsed = None
+        self._frame_timestamp = None
         self._finished = False
         
         self._sample = int(sample)
-        self._samples = []
+        self._samples = deque(maxlen=self._sample)
+        self._samples_cache = None
+        
+        self._chunk = int(chunk or 0)
         
         self._size = int(size)
         self._refresh = float(refresh)
@@ -119,6 +221,18 @@ class Bar(object):
         self._next_update = None
         
         self._output = output
+        self._last_line = None
+        self._tty = True
+        self._clear = LINE_CLEAR + "\r"
+        self._end = ""
+        self._interval = self._refresh
+        
+        self._lock = threading.RLock()
+        self._value_lock = threading.Lock()
+        self._rendering = False
+        self._background = bool(background)
+        self._thread = None
+        self._thread_stop = None
     
     
     def __enter__(self):
@@ -137,7 +251,24 @@ class Bar(object):
     def __iadd__(self, value):
         """Increases current progress by given value."""
         
-        self.increase(value)
+        # increase value
+        with self._value_lock:
+            current = self._curr_value
+            value = value + current if current else value
+            self._curr_value = value
+        
+        # leave sampling and refresh to background thread
+        if self._thread is not None:
+            return self
+        
+        # skip sampling and refresh if throttled
+        now = time.perf_counter()
+        next_update = self._next_update
+        if next_update is not None and now < next_update and not self._finished:
+            return self
+        
+        # update progress
+        self._slow_update(value, now)
         return self
     
     
@@ -177,11 +308,33 @@ class Bar(object):
     def __iter__(self):
         """Iterate over current items."""
         
+        # increase by every item
+        if not self._chunk:
+            try:
+                for item in self._items:
+                    self.increase()
+                    yield item
+            finally:
+                self.finish(*self._widgets_finish)
+            return
+        
+        # start progress
+        items = self._items
+        self.start()
+        
+        # increase by chunks
+        chunk = self._chunk
+        count = 0
         try:
-            for item in self._items:
-                self.increase()
+            for item in items:
+                count += 1
+                if count == chunk:
+                    self.increase(count)
+                    count = 0
                 yield item
         finally:
+            if count:
+                self.increase(count)
             self.finish(*self._widgets_finish)
     
     
@@ -220,13 +373,11 @@ class Bar(object):
     def elapsed(self):
         """Returns current elapsed time in seconds."""
         
-        if self._start_time is None:
-            return 0
+        # use time of current refresh
+        if self._frame_elapsed is not None:
+            return self._frame_elapsed
         
-        if self._end_time is not None:
-            return self._end_time - self._start_time
-        
-        return time.time() - self._start_time
+        return self._elapsed(time.perf_counter())
     
     
     @property
@@ -240,7 +391,22 @@ class Bar(object):
     def samples(self):
         """Returns last progress samples as ((value, elapsed),)."""
         
-        return tuple(self._samples)
+        # make samples
+        if self._samples_cache is None:
+            self._samples_cache = tuple(self._samples)
+        
+        return self._samples_cache
+    
+    
+    @property
+    def timestamp(self):
+        """Returns current time in seconds since the epoch."""
+        
+        # use time of current refresh
+        if self._frame_timestamp is not None:
+            return self._frame_timestamp
+        
+        return time.time()
     
     
     @property
@@ -253,6 +419,8 @@ class Bar(object):
     def reset(self):
         """Resets current progress back to initial state."""
         
+        self._stop_thread()
+        
         self._curr_value = None
         self._items = None
         
@@ -260,23 +428,20 @@ class Bar(object):
         self._end_time = None
         self._finished = False
         
-        self._samples = []
+        self._samples = deque(maxlen=self._sample)
+        self._samples_cache = None
         
         self._updates = 0
         self._update_time = None
         self._next_update = None
+        
+        self._last_line = None
     
     
     def refresh(self):
         """Updates current progress time and refreshes displayed bar."""
         
-        # show widgets
-        line = self._format_widgets(self._widgets)
-        self._write_line("\r", line, "")
-        
-        # set update time
-        self._update_time = time.time()
-        self._updates += 1
+        self._redraw(True)
     
     
     def start(self, value=0, minimum=None, maximum=None):
@@ -300,8 +465,11 @@ class Bar(object):
         # reset current progress
         self.reset()
         
+        # check output
+        self._check_output()
+        
         # set start time
-        self._start_time = time.time()
+        self._start_time = time.perf_counter()
         
         # reset range
         if minimum is not None:
@@ -309,10 +477,22 @@ class Bar(object):
         if maximum is not None:
             self._max_value = maximum
         
-        # init widgets
+        # use default widgets
         if not self._widgets:
-            self._widgets = [DEFAULT_BAR] if self._max_value else [DEFAULT_BAR_NOMAX]
-        self._widgets = self._init_widgets(self._widgets)
+            self._widgets, variables = DEFAULT_BAR_WIDGETS if self._max_value else DEFAULT_BAR_NOMAX_WIDGETS
+            self._variables.update(variables)
+            self._layout = self._make_layout(self._widgets)
+            self._widgets_initialized = True
+        
+        # init widgets
+        elif not self._widgets_initialized:
+            self._widgets = self._init_widgets(self._widgets)
+            self._layout = self._make_layout(self._widgets)
+            self._widgets_initialized = True
+        
+        # start background refresh
+        if self._background:
+            self._start_thread()
         
         # update progress
         self.update(value)
@@ -339,22 +519,20 @@ class Bar(object):
             self.start(value)
             return
         
-        # update and sample current value
-        if value is not None:
-            self._curr_value = value
-            self._samples.append((value, self.elapsed))
+        now = time.perf_counter()
         
-        # remove old samples
-        while len(self._samples) > self._sample:
-            self._samples.pop(0)
+        # skip unchanged value until next refresh is due
+        if value is not None and value == self._curr_value and refresh is None:
+            next_update = self._next_update
+            if next_update is not None and now < next_update and not self._finished:
+                return
         
-        # block refresh
-        if refresh is False:
-            return
+        # set current value
+        if value is not None:
+            self._curr_value = value
         
-        # refresh widgets if forced or needed
-        if refresh or self._should_update():
-            self.refresh()
+        # update progress
+        self._update(now, refresh)
     
     
     def increase(self, value=1):
@@ -369,10 +547,24 @@ class Bar(object):
         """
         
         # increase value
-        value = value + self._curr_value if self._curr_value else value
+        with self._value_lock:
+            value = value + self._curr_value if self._curr_value else value
+            self._curr_value = value
+        
+        # leave sampling and refresh to background thread
+        if self._thread is not None:
+            return
+        
+        # get current time
+        now = time.perf_counter()
+        
+        # skip sampling and refresh if throttled
+        if self._next_update is not None and not self._finished:
+            if now < self._next_update:
+                return
         
         # update progress
-        self.update(value)
+        self._slow_update(value, now)
     
     
     def finish(self, *widgets):
@@ -398,8 +590,11 @@ class Bar(object):
             self.write(*widgets, permanent=True)
             return
         
+        # stop background refresh
+        self._stop_thread()
+        
         # set state
-        self._end_time = time.time()
+        self._end_time = time.perf_counter()
         self._finished = True
         
         # update with max value
@@ -408,12 +603,12 @@ class Bar(object):
         # write final widgets
         widgets = self._init_widgets(widgets)
         if widgets:
-            self.write(*widgets, permanent=True)
+            self._write_widgets(widgets, True)
         
         # clear last
-        else:
-            self._write_line("\r", " ", "")
-            self._write_line("\r", "", "")
+        elif self._tty:
+            self._emit((self._clear,))
+            self._last_line = None
     
     
     def write(self, *widgets, permanent=True):
@@ -433,20 +628,11 @@ class Bar(object):
                 visible even after next progress update.
         """
         
-        # format widgets
+        # init widgets
         widgets = self._init_widgets(widgets)
-        line = self._format_widgets(widgets)
-        
-        # get end
-        end = "\n" if permanent else ""
         
-        # write line
-        self._write_line("\r", line, end)
-        
-        # show progress back
-        if permanent and self._updates and not self._finished:
-            line = self._format_widgets(self._widgets)
-            self._write_line("\r", line, "")
+        # write widgets
+        self._write_widgets(widgets, permanent)
     
     
     def register(self, tag, widget):
@@ -477,8 +663,13 @@ class Bar(object):
         # add to variables
         self._variables[tag] = widget
         
-        # try to init previously unrecognized widgets
-        self._widgets = self._init_widgets(self._widgets)
+        # reset resolved templates
+        self._templates.clear()
+        
+        # replace previously unrecognized widget
+        if self._widgets_initialized:
+            self._widgets = tuple(widget if isinstance(x, str) and x.lower() == tag else x for x in self._widgets)
+            self._layout = self._make_layout(self._widgets)
     
     
     def widget(self, tag):
@@ -501,7 +692,168 @@ class Bar(object):
         return self._variables[tag]
     
     
-    def _should_update(self):
+    def _write_widgets(self, widgets, permanent):
+        """Writes initialized widgets to current output."""
+        
+        # prepare layout
+        layout = self._make_layout(widgets)
+        
+        with self._lock:
+            
+            # check call from within widgets
+            nested = self._rendering
+            
+            # freeze time for all widgets
+            if not nested:
+                self._frame_elapsed = self._elapsed(time.perf_counter())
+                self._frame_timestamp = time.time()
+            
+            self._rendering = True
+            try:
+                
+                # init segments
+                line = self._format_widgets(layout)
+                segments = [self._clear, line, "\n" if permanent else self._end]
+                self._last_line = None
+                
+                # show progress back
+                if permanent and self._tty and self._updates and not self._finished and not nested:
+                    line = self._format_widgets(self._layout)
+                    segments += (self._clear, line)
+                    self._last_line = line
+            
+            finally:
+                self._rendering = nested
+                if not nested:
+                    self._frame_elapsed = None
+                    self._frame_timestamp = None
+            
+            # write segments
+            self._emit(segments)
+    
+    
+    def _redraw(self, force):
+        """
+        Samples current value, formats widgets and shows them if forced or
+        changed since last shown.
+        """
+        
+        with self._lock:
+            
+            # skip nested refresh from within widgets
+            if self._rendering:
+                return
+            
+            # freeze time for all widgets
+            now = time.perf_counter()
+            self._frame_elapsed = self._elapsed(now)
+            self._frame_timestamp = time.time()
+            
+            # sample current value
+            if self._curr_value is not None:
+                self._samples.append((self._curr_value, self._frame_elapsed))
+                self._samples_cache = None
+            
+            # format widgets
+            self._rendering = True
+            try:
+                line = self._format_widgets(self._layout)
+            finally:
+                self._rendering = False
+                self._frame_elapsed = None
+                self._frame_timestamp = None
+            
+            # show widgets if changed or forced
+            if force or line != self._last_line or self._finished:
+                self._emit((self._clear, line, self._end))
+                self._last_line = line
+            
+            # set update time
+            self._update_time = now
+            self._next_update = now + self._interval
+            self._updates += 1
+    
+    
+    def _update(self, now, refresh=None):
+        """Refreshes displayed bar if needed."""
+        
+        # block refresh
+        if refresh is False:
+            return
+        
+        # refresh widgets if forced
+        if refresh:
+            self._redraw(True)
+        
+        # refresh widgets if needed
+        elif self._should_update(now):
+            self._redraw(False)
+    
+    
+    def _slow_update(self, value, now):
+        """Starts progress if needed or refreshes increased value."""
+        
+        # start if needed
+        if self._start_time is None:
+            self.start(value)
+            return
+        
+        # update progress
+        self._update(now)
+    
+    
+    def _start_thread(self):
+        """Starts background refresh thread."""
+        
+        # stop running thread
+        self._stop_thread()
+        
+        # start new thread
+        self._thread_stop = threading.Event()
+        self._thread = threading.Thread(target=self._run_thread, args=(self._thread_stop,), daemon=True)
+        self._thread.start()
+    
+    
+    def _stop_thread(self):
+        """Stops background refresh thread."""
+        
+        # check thread
+        if self._thread is None:
+            return
+        
+        # stop thread
+        self._thread_stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        
+        self._thread = None
+        self._thread_stop = None
+    
+    
+    def _run_thread(self, stop):
+        """Refreshes displayed bar until stopped."""
+        
+        # avoid busy loop
+        interval = max(self._interval, 0.01)
+        
+        # refresh bar
+        while not stop.wait(interval):
+            self._redraw(False)
+    
+    
+    def _elapsed(self, now):
+        """Calculates elapsed time in seconds for given performance counter."""
+        
+        if self._start_time is None:
+            return 0
+        
+        if self._end_time is not None:
+            return self._end_time - self._start_time
+        
+        return now - self._start_time
+    
+    
+    def _should_update(self, now):
         """Checks whether widgets should be updated."""
         
         # check finished
@@ -512,8 +864,12 @@ class Bar(object):
         if self._update_time is None:
             return True
         
-        # check last update time
-        if time.time() - self._update_time >= self._refresh:
+        # leave to background thread
+        if self._thread is not None:
+            return False
+        
+        # check next update time
+        if now >= self._next_update:
             return True
         
         return False
@@ -522,6 +878,10 @@ class Bar(object):
     def _init_widgets(self, widgets):
         """Initializes all widgets given by template string."""
         
+        # check ready widgets
+        if all(isinstance(w, Widget) for w in widgets):
+            return tuple(widgets)
+        
         # make editable
         buff = []
         
@@ -537,14 +897,19 @@ class Bar(object):
                 buff.append(widget)
                 continue
             
-            # split template
-            items = WIDGETS_PATTERN.split(widget)
+            # simple text
+            if "{" not in widget:
+                buff.append(widget)
+                continue
+            
+            # use resolved template
+            if widget in self._templates:
+                buff.extend(self._templates[widget])
+                continue
             
             # init template widgets
-            for item in items:
-                
-                # make tag
-                tag = item.lower()
+            resolved = []
+            for tag, item in _tokenize_template(widget):
                 
                 # get custom variable
                 if tag in self._variables:
@@ -552,73 +917,131 @@ class Bar(object):
                 
                 # get known widget
                 elif tag in WIDGETS:
-                    cls, kwargs = WIDGETS[tag]
-                    item = cls(**kwargs)
+                    item = create_widget(tag)
                     self._variables[tag] = item
                 
-                # add to progress
-                buff.append(item)
+                # add to template
+                resolved.append(item)
+            
+            # remove oldest template
+            if len(self._templates) >= TEMPLATES_CACHE:
+                self._templates.popitem(last=False)
+            
+            # store resolved template
+            self._templates[widget] = tuple(resolved)
+            buff.extend(resolved)
         
         return tuple(buff)
     
     
-    def _format_widgets(self, widgets):
-        """Formats widgets line."""
+    def _make_layout(self, widgets):
+        """
+        Prepares initialized widgets for formatting as
+        (results, fixed, expanding, static).
+        """
         
-        # init buffs
-        space = self._size
         results = []
+        fixed = []
         expanding = []
+        static = 0
         
-        # prepare widgets
+        # resolve widgets
         for idx, widget in enumerate(widgets):
             
             # add simple string
             if isinstance(widget, str):
                 results.append(widget)
-                space -= len(widget)
+                static += len(widget)
+                continue
             
             # block non-widgets
-            elif not isinstance(widget, Widget):
+            if not isinstance(widget, Widget):
                 raise TypeError("Unrecognized widget type.")
             
+            # reserve widget slot
+            results.append("")
+            
             # add expandable widget
-            elif widget.EXPAND:
-                results.append(widget)
-                expanding.insert(0, idx)
+            if widget.EXPAND:
+                expanding.append((idx, widget))
             
             # add regular widget
             else:
-                text = widget(self)
-                results.append(text)
-                space -= len(text)
+                fixed.append((idx, widget.__call__))
+        
+        return results, tuple(fixed), tuple(expanding), static
+    
+    
+    def _format_widgets(self, layout):
+        """Formats widgets line."""
+        
+        results, fixed, expanding, static = layout
+        
+        # format regular widgets
+        for idx, call in fixed:
+            results[idx] = call(self)
         
         # finalize expandable
-        count = len(expanding)
-        while count:
-            width = max(int(math.ceil(space * 1. / count)), 0)
-            idx = expanding.pop()
-            text = results[idx](self, width)
-            results[idx] = text
-            space -= len(text)
-            count -= 1
+        if expanding:
+            
+            # get available space
+            space = self._size - static
+            for idx, call in fixed:
+                space -= len(results[idx])
+            
+            # format expandable widgets
+            count = len(expanding)
+            for idx, widget in expanding:
+                width = (space + count - 1) // count if space > 0 else 0
+                text = widget(self, width)
+                results[idx] = text
+                space -= len(text)
+                count -= 1
         
         # join widgets
-        line = ''.join(results)
-        
-        return line
+        return ''.join(results)
+    
     
+    def _check_output(self):
+        """Checks whether current output is a terminal."""
+        
+        # get output
+        output = sys.stdout if self._output is None else self._output
+        
+        # check redirection of real file object to file or pipe
+        self._tty = True
+        if isinstance(output, (io.TextIOWrapper, io.BufferedWriter, io.FileIO)):
+            try:
+                mode = os.fstat(output.fileno()).st_mode
+                self._tty = not (stat.S_ISREG(mode) or stat.S_ISFIFO(mode))
+            except (OSError, ValueError):
+                pass
+        
+        # set line controls and refresh interval
+        self._clear = LINE_CLEAR + "\r" if self._tty else ""
+        self._end = "" if self._tty else "\n"
+        self._interval = self._refresh if self._tty else max(self._refresh, REFRESH_NOTTY)
     
-    def _write_line(self, pref, line, end):
-        """Writes line to current output."""
+    
+    def _emit(self, segments):
+        """Writes all segments to current output at once."""
+        
+        # get output
+        output = sys.stdout if self._output is None else self._output
         
-        # print line
-        if self._output is None:
-            print(end=LINE_CLEAR)
-            print(pref + line, end=end)
+        # skip missing output (e.g. pythonw)
+        if output is None:
             return
         
-        # write line
-        self._output.write(LINE_CLEAR)
-        self._output.write(pref + line + end)
-        self._output.flush()
+        # write encoded segments directly to plain stdout buffer
+        raw = output.buffer if self._output is None and type(output) is io.TextIOWrapper else None
+        if raw is not None:
+            output.flush()
+            raw.write("".join(segments).encode(output.encoding or "utf-8", output.errors or "strict"))
+            raw.flush()
+            return
+        
+        # write segments
+        output.write("".join(segments))
+        output.flush()
+
@@ -31,6 +31,9 @@ LINE_UP = "\033[1A"
 LINE_CLEAR = "\x1b[2K"
 NA = "N/A"
 
+# minimum refresh interval for non-terminal output
+REFRESH_NOTTY = 2.0
+
 # define time portions
 MINUTE = 60
 HOUR = 60 * MINUTE
@@ -21,8 +21,25 @@ def register(tag, widget, **kwargs):
     if not issubclass(widget, Widget):
         raise TypeError("Widget must be derived from the gress.Widget class!")
     
+    # init shared instance (flag must be set by the class itself, not inherited)
+    shared = widget(**kwargs) if widget.__dict__.get("SHARED", False) else None
+    
     # register widget
-    WIDGETS[tag] = (widget, kwargs)
+    WIDGETS[tag] = (widget, kwargs, shared)
+
+
+def create_widget(tag):
+    """Creates widget instance registered under given tag."""
+    
+    # get widget
+    widget, kwargs, shared = WIDGETS[tag]
+    
+    # use shared instance
+    if shared is not None:
+        return shared
+    
+    # init new instance
+    return widget(**kwargs)
 
 
 # register Property widgets
@@ -1,45 +1,24 @@
 #  Created byMartin.cz
 #  Copyright (c) Martin Strohalm. All rights reserved.
 
-import math
+import bisect
+import functools
 from .enums import *
 
+# init power thresholds cache
+THRESHOLDS = {}
+
 
 def format_time(seconds, template=None, units=False):
     """Formats time according to given seconds."""
     
-    days = 0
-    hours = 0
-    minutes = 0
-    
-    # use template
-    if template:
-        
-        # get days
-        if "{d" in template:
-            days = int(seconds / DAY)
-            seconds %= DAY
-        
-        # get hours
-        if "{h" in template:
-            hours = int(seconds / HOUR)
-            seconds %= HOUR
-        
-        # get minutes
-        if "{m" in template:
-            minutes = int(seconds / MINUTE)
-            seconds %= MINUTE
-    
     # make template according to current range
-    else:
+    if not template:
         
         # split seconds
-        days = int(seconds / DAY)
-        seconds %= DAY
-        hours = int(seconds / HOUR)
-        seconds %= HOUR
-        minutes = int(seconds / MINUTE)
-        seconds %= MINUTE
+        days, rest = divmod(int(seconds), DAY)
+        hours, rest = divmod(rest, HOUR)
+        minutes, rest = divmod(rest, MINUTE)
         
         # show days
         if days:
@@ -58,7 +37,79 @@ def format_time(seconds, template=None, units=False):
             template = TIME_S_U if units else TIME_S
     
     # format time
-    return template.format(d=int(days), h=int(hours), m=int(minutes), s=int(seconds))
+    return parse_time_template(template)(seconds)
+
+
+@functools.lru_cache(maxsize=64)
+def parse_time_template(template):
+    """Creates time formatter for given template as callable(seconds) -> str."""
+    
+    # format common templates directly
+    if template == TIME_HMS:
+        def formatter(seconds):
+            hours, seconds = divmod(int(seconds), HOUR)
+            minutes, seconds = divmod(seconds, MINUTE)
+            return f"{hours:02}:{minutes:02}:{seconds:02}"
+        
+        return formatter
+    
+    if template == TIME_MS:
+        def formatter(seconds):
+            minutes, seconds = divmod(int(seconds), MINUTE)
+            return f"{minutes:02}:{seconds:02}"
+        
+        return formatter
+    
+    if template == TIME_S:
+        def formatter(seconds):
+            return f"{int(seconds)}"
+        
+        return formatter
+    
+    # get used parts
+    use_days = "{d" in template
+    use_hours = "{h" in template
+    use_minutes = "{m" in template
+    
+    # format custom template
+    def formatter(seconds):
+        
+        seconds = int(seconds)
+        days = 0
+        hours = 0
+        minutes = 0
+        
+        # get days
+        if use_days:
+            days, seconds = divmod(seconds, DAY)
+        
+        # get hours
+        if use_hours:
+            hours, seconds = divmod(seconds, HOUR)
+        
+        # get minutes
+        if use_minutes:
+            minutes, seconds = divmod(seconds, MINUTE)
+        
+        return template.format(d=days, h=hours, m=minutes, s=seconds)
+    
+    return formatter
+
+
+def parse_value_template(template):
+    """Creates value formatter for given template as callable(value) -> str."""
+    
+    # use plain conversion
+    if not template:
+        return str
+    
+    # use format spec directly (e.g. "{:.2f}")
+    if template.startswith("{:") and template.endswith("}") and template.count("{") == 1 and template.count("}") == 1:
+        spec = template[2:-1]
+        return lambda value: format(value, spec)
+    
+    # use template
+    return template.format
 
 
 def format_power(value, template="{:.2f}", prefixes=PREFIXES, step=1000):
@@ -68,15 +119,31 @@ def format_power(value, template="{:.2f}", prefixes=PREFIXES, step=1000):
     if not prefixes:
         return template.format(value) if template else str(value)
     
+    # scale value
+    scaled, prefix = scale_power(value, prefixes, step)
+    
+    # format value
+    scaled = template.format(scaled) if template else scaled
+    return "%s%s" % (scaled, prefix)
+
+
+def scale_power(value, prefixes=PREFIXES, step=1000):
+    """Scales value according to value power as (scaled, prefix)."""
+    
+    # get power thresholds
+    key = (step, len(prefixes))
+    thresholds = THRESHOLDS.get(key)
+    if thresholds is None:
+        thresholds = tuple(step**i for i in range(len(prefixes)))
+        THRESHOLDS[key] = thresholds
+    
     # init
     scaled = 0
     power = 0
     
     # scale value
     if value >= 2e-6:
-        power = int(math.log(value, step))
-        scaled = value / step**power
+        power = max(bisect.bisect_right(thresholds, value) - 1, 0)
+        scaled = value / thresholds[power]
     
-    # format value
-    scaled = template.format(scaled) if template else scaled
-    return "%s%s" % (scaled, prefixes[power])
+    return scaled, prefixes[power]
@@ -4,9 +4,12 @@
 #  Inspired by the original work of Nilton Volpato.
 #  https://github.com/NiltonVolpato/python-progressbar
 
+import time
 import datetime
+from operator import attrgetter
+from collections import OrderedDict
 from .enums import *
-from .utils import format_time, format_power
+from .utils import format_time, scale_power, parse_time_template, parse_value_template
 
 
 class Widget(object):
@@ -14,12 +17,18 @@ class Widget(object):
     Provides a base class for all the progress widgets. Each derived class must
     implement the __call__ method, which is called by the progress bar to update
     the widget.
+    
+    Widgets keeping no state between the calls can set the SHARED flag, so that
+    a single instance of predefined widget is used by all the progress bars.
+    The flag is not inherited, derived classes must set it explicitly.
     """
     
     EXPAND = False
+    SHARED = False
+    __slots__ = ()
     
     
-    def __call__(self, progress, width=None, *args, **kwargs):
+    def __call__(self, progress, width=None):
         """Formats current progress."""
         
         raise NotImplementedError("The '%s' widget does not implement the call method!" % self.__name__)
@@ -30,28 +39,52 @@ class Callback(Widget):
     The Callback widget provides a special type of widgets to displays custom
     variables within the progress bar retrieved by specified callback function.
     The callback is typically specified as a lambda function with no input
-    parameters, returning the final formatted custom value.
+    parameters, returning the final formatted custom value. If the value changes
+    slowly, the refresh interval can be set to reuse the last value meanwhile.
     """
     
+    __slots__ = ("_callback", "_refresh", "_cache")
+    
     
-    def __init__(self, callback):
+    def __init__(self, callback, refresh=0):
         """
         Initializes a new instance of the Callback widget.
         
         Args:
             callback: callable
                 Custom function to be used to retrieve and format the value.
+            
+            refresh: float
+                Minimum number of seconds between individual callback calls.
+                If set to 0, the callback is called on every update.
         """
         
         super().__init__()
         
         self._callback = callback
+        self._refresh = float(refresh)
+        
+        self._cache = (None, "")
     
     
-    def __call__(self, progress, *args, **kwargs):
+    def __call__(self, progress):
         """Formats current progress."""
         
-        return str(self._callback())
+        # call directly
+        if not self._refresh:
+            return str(self._callback())
+        
+        # use cached value
+        now = time.perf_counter()
+        cache = self._cache
+        if cache[0] is not None and now - cache[0] < self._refresh:
+            return cache[1]
+        
+        # retrieve value
+        value = str(self._callback())
+        self._cache = (now, value)
+        
+        return value
 
 
 class Variable(Widget):
@@ -65,6 +98,8 @@ class Variable(Widget):
             Current variable value.
     """
     
+    __slots__ = ("value", "_template")
+    
     
     def __init__(self, value="", template=None):
         """
@@ -85,7 +120,7 @@ class Variable(Widget):
         self._template = template
     
     
-    def __call__(self, progress, *args, **kwargs):
+    def __call__(self, progress):
         """Formats current progress."""
         
         return self._template.format(self.value) if self._template else str(self.value)
@@ -101,6 +136,9 @@ class Property(Widget):
     (e.g. 1024 for data).
     """
     
+    SHARED = True
+    __slots__ = ("_name", "_template", "_prefixes", "_step", "_getter", "_formatter")
+    
     
     def __init__(self, name, template=None, prefixes=None, step=1000):
         """
@@ -128,20 +166,28 @@ class Property(Widget):
         self._template = template
         self._prefixes = prefixes
         self._step = step
+        
+        self._getter = attrgetter(name)
+        self._formatter = parse_value_template(template)
     
     
-    def __call__(self, progress, *args, **kwargs):
+    def __call__(self, progress):
         """Formats current progress."""
         
         # get value
-        value = getattr(progress, self._name)
+        value = self._getter(progress)
         
         # check value
         if value is None:
             return NA
         
-        # format value
-        return format_power(value, self._template, self._prefixes, self._step)
+        # format value directly
+        if not self._prefixes:
+            return self._formatter(value)
+        
+        # format scaled value
+        value, prefix = scale_power(value, self._prefixes, self._step)
+        return self._formatter(value) + prefix
 
 
 class Time(Widget):
@@ -150,6 +196,9 @@ class Time(Widget):
     should follow the standard datetime notation (e.g. "%Y-%m-%d %H:%M:%S").
     """
     
+    SHARED = True
+    __slots__ = ("_template", "_cached", "_cache")
+    
     
     def __init__(self, template=None):
         """
@@ -165,20 +214,33 @@ class Time(Widget):
         super().__init__()
         
         self._template = template
+        self._cached = bool(template) and "%f" not in template
+        self._cache = (None, None)
     
     
-    def __call__(self, progress, *args, **kwargs):
+    def __call__(self, progress):
         """Formats current progress."""
         
-        # get current time
-        now = datetime.datetime.now()
+        # use default
+        if not self._template:
+            return str(datetime.datetime.now())
         
         # use custom template
-        if self._template:
-            return now.strftime(self._template)
+        if not self._cached:
+            return datetime.datetime.now().strftime(self._template)
         
-        # use default
-        return str(now)
+        # use cached value within the same second
+        stamp = time.time()
+        second = int(stamp)
+        cache = self._cache
+        if second == cache[0]:
+            return cache[1]
+        
+        # format time
+        value = datetime.datetime.fromtimestamp(stamp).strftime(self._template)
+        self._cache = (second, value)
+        
+        return value
 
 
 class Timer(Widget):
@@ -189,6 +251,9 @@ class Timer(Widget):
     Optionally, the time units can be displayed if automatic formatting is used.
     """
     
+    SHARED = True
+    __slots__ = ("_template", "_units", "_formatter")
+    
     
     def __init__(self, template=TIME_HMS, units=False):
         """
@@ -210,16 +275,19 @@ class Timer(Widget):
         
         self._template = template
         self._units = units
+        
+        self._formatter = parse_time_template(template) if template else None
     
     
-    def __call__(self, progress, *args, **kwargs):
+    def __call__(self, progress):
         """Formats current progress."""
         
-        # calc elapsed
-        elapsed = datetime.timedelta(seconds=int(progress.elapsed))
+        # format by template
+        if self._formatter is not None:
+            return self._formatter(progress.elapsed)
         
-        # format delta
-        return format_time(elapsed.seconds, self._template, self._units)
+        # format elapsed
+        return format_time(int(progress.elapsed), None, self._units)
 
 
 class ETA(Widget):
@@ -236,6 +304,10 @@ class ETA(Widget):
     elapsed time and progress is used.
     """
     
+    SHARED = True
+    CACHE_SIZE = 64
+    __slots__ = ("_template", "_units", "_absolute", "_adaptive", "_formatter", "_times")
+    
     
     def __init__(self, template=TIME_HMS, units=False, absolute=False, adaptive=True):
         """
@@ -270,9 +342,12 @@ class ETA(Widget):
         self._units = units
         self._absolute = absolute
         self._adaptive = adaptive
+        
+        self._formatter = parse_time_template(template) if template else None
+        self._times = OrderedDict()
     
     
-    def __call__(self, progress, *args, **kwargs):
+    def __call__(self, progress):
         """Formats current progress."""
         
         # unknown max value or zero current
@@ -281,7 +356,7 @@ class ETA(Widget):
         
         # already finished
         if progress.finished:
-            return format_time(0, self._template, self._units)
+            return self._format_time(0)
         
         # get progress
         current = progress.current
@@ -296,15 +371,47 @@ class ETA(Widget):
                 elapsed -= oldest[1]
         
         # calc ETA
-        eta = datetime.timedelta(seconds=int(remains * (elapsed / current)))
+        eta = int(remains * (elapsed / current))
         
         # show absolute time
         if self._absolute:
-            eta = datetime.datetime.now() + eta
-            return eta.strftime(TIME_ABS)
+            return self._format_absolute(int(progress.timestamp + eta))
+        
+        # format remaining
+        return self._format_time(eta)
+    
+    
+    def _format_time(self, seconds):
+        """Formats remaining time."""
+        
+        # format by template
+        if self._formatter is not None:
+            return self._formatter(seconds)
         
-        # format delta
-        return format_time(eta.seconds, self._template, self._units)
+        # format automatically
+        return format_time(seconds, None, self._units)
+    
+    
+    def _format_absolute(self, stamp):
+        """Formats absolute time of given timestamp."""
+        
+        # use cached value
+        times = self._times
+        value = times.get(stamp)
+        if value is not None:
+            return value
+        
+        # format time
+        value = datetime.datetime.fromtimestamp(stamp).strftime(TIME_ABS)
+        
+        # remove oldest
+        if len(times) >= self.CACHE_SIZE:
+            times.popitem(last=False)
+        
+        # store value
+        times[stamp] = value
+        
+        return value
 
 
 class Speed(Widget):
@@ -321,6 +428,9 @@ class Speed(Widget):
     elapsed time and progress is used.
     """
     
+    SHARED = True
+    __slots__ = ("_template", "_prefixes", "_step", "_adaptive", "_formatter")
+    
     
     def __init__(self, template="{:.2f}", prefixes=None, step=1000, adaptive=True):
         """
@@ -348,9 +458,11 @@ class Speed(Widget):
         self._prefixes = prefixes
         self._step = step
         self._adaptive = adaptive
+        
+        self._formatter = parse_value_template(template)
     
     
-    def __call__(self, progress, *args, **kwargs):
+    def __call__(self, progress):
         """Formats current progress."""
         
         # get progress
@@ -369,8 +481,13 @@ class Speed(Widget):
         if elapsed >= 2e-6 and current >= 2e-6:
             speed = current / elapsed
         
-        # format speed
-        return format_power(speed, self._template, self._prefixes, self._step)
+        # format speed directly
+        if not self._prefixes:
+            return self._formatter(speed)
+        
+        # format scaled speed
+        speed, prefix = scale_power(speed, self._prefixes, self._step)
+        return self._formatter(speed) + prefix
 
 
 class Gauge(Widget):
@@ -384,6 +501,8 @@ class Gauge(Widget):
     """
     
     EXPAND = True
+    SHARED = True
+    __slots__ = ("_marker", "_left", "_right", "_fill", "_tip", "_size", "_edges_width", "_marker_width", "_repeats", "_finished")
     
     
     def __init__(self, marker="|", left="|", right="|", fill="-", tip="", size=None):
@@ -419,24 +538,40 @@ class Gauge(Widget):
         self._fill = fill
         self._tip = tip
         self._size = size
+        
+        self._edges_width = len(left) + len(right)
+        self._marker_width = len(marker)
+        self._repeats = {}
+        self._finished = (None, None)
     
     
-    def __call__(self, progress, width=0, *args, **kwargs):
+    def __call__(self, progress, width=0):
         """Formats current progress."""
         
         # get available width
         width = width if self._size is None else self._size
-        width -= len(self._left) + len(self._right)
+        width -= self._edges_width
         
         # fill if finished
         if progress.finished:
-            return '%s%s%s' % (self._left, width * self._fill, self._right)
+            
+            # use cached bar
+            finished = self._finished
+            if finished[0] == width:
+                return finished[1]
+            
+            # make full bar
+            bar = f"{self._left}{self._repeat(self._fill, width)}{self._right}"
+            self._finished = (width, bar)
+            
+            return bar
         
         # show current progress
         if progress.maximum:
             
             # fill current progress
-            bar = self._marker * int(progress.percent / 100 * width)
+            filled = int(progress.current * width // progress.maximum)
+            bar = self._repeat(self._marker, filled)
             if bar and self._tip and not progress.finished:
                 bar = bar[:-1] + self._tip
             
@@ -452,14 +587,33 @@ class Gauge(Widget):
                 position = width * 2 - position
             
             # get pads
-            pad_left = self._fill * (position - 1)
-            pad_right = self._fill * (width - len(self._marker) - len(pad_left))
+            pad_left = self._repeat(self._fill, position - 1)
+            pad_right = self._repeat(self._fill, width - self._marker_width - len(pad_left))
             
             # fill bar
-            bar = "%s%s%s" % (pad_left, self._marker, pad_right)
+            bar = f"{pad_left}{self._marker}{pad_right}"
         
         # make full bar
-        return "%s%s%s" % (self._left, bar, self._right)
+        return f"{self._left}{bar}{self._right}"
+    
+    
+    def _repeat(self, text, count):
+        """Returns given text repeated specified number of times."""
+        
+        # check count
+        if count <= 0:
+            return ""
+        
+        # get cached text
+        size = count * len(text)
+        cache = self._repeats.get(text, "")
+        
+        # extend cache
+        if len(cache) < size:
+            cache = text * count
+            self._repeats[text] = cache
+        
+        return cache[:size]
 
 
 class Spin(Widget):
@@ -471,6 +625,8 @@ class Spin(Widget):
     through them.
     """
     
+    __slots__ = ("_markers", "_fin", "_relative", "_current", "_markers_count")
+    
     
     def __init__(self, markers=STAR, fin=None, relative=False):
         """
@@ -496,9 +652,11 @@ class Spin(Widget):
         self._fin = fin
         self._relative = relative
         self._current = -1
+        
+        self._markers_count = len(markers)
     
     
-    def __call__(self, progress, width=0, *args, **kwargs):
+    def __call__(self, progress, width=0):
         """Formats current progress."""
         
         # check for finish
@@ -507,9 +665,14 @@ class Spin(Widget):
         
         # use relative
         if self._relative and progress.maximum:
-            self._current = int(len(self._markers) * progress.percent / 100)
+            index = int(self._markers_count * progress.current // progress.maximum)
+            self._current = min(index, self._markers_count - 1)
             return self._markers[self._current]
         
         # get next marker
-        self._current = (self._current + 1) % len(self._markers)
-        return self._markers[self._current]
+        current = self._current + 1
+        if current >= self._markers_count:
+            current = 0
+        
+        self._current = current
+        return self._markers[current]